@@ -8,6 +8,7 @@ from airflow.operators.python import PythonOperator
 from airflow.operators.bash import BashOperator
 from airflow.sensors.filesystem import FileSensor
 from airflow.utils.dates import days_ago
+from airflow.utils.task_group import TaskGroup
 import sys
 import os
 
@@ -22,6 +23,17 @@ from load_to_postgres import load_to_postgres
 from generate_report import generate_report
 from notify_slack import send_slack_notification
 
+def notify_success(context):
+    """Send success notification via Slack when the DAG run completes."""
+    send_slack_notification(success=True)
+
+
+def notify_failure(context):
+    """Send failure notification via Slack."""
+    error_msg = str(context.get('exception', 'Unknown error'))
+    send_slack_notification(success=False, error_message=error_msg)
+
+
 # Default arguments for the DAG
 default_args = {
     'owner': 'data_engineer',
@@ -42,6 +54,10 @@ with DAG(
     start_date=days_ago(1),
     catchup=False,
     tags=['etl', 'taxi', 'ml', 'analytics'],
+    # Slack notification runs as a DAG-level callback instead of a dedicated
+    # task - one less task instance for the scheduler to schedule per run
+    on_success_callback=notify_success,
+    on_failure_callback=notify_failure,
     doc_md="""
     # NYC Taxi ETL Pipeline
     
@@ -53,7 +69,7 @@ with DAG(
     4. **ML Training**: Trains trip duration prediction model
     5. **PostgreSQL Load**: Stores data for Power BI dashboards
     6. **Report Generation**: Creates PDF analytics report
-    7. **Notification**: Sends Slack notification on completion
+    7. **Notification**: Slack notification via DAG success/failure callbacks
     
     ## Data Source
     NYC Taxi Trip Duration dataset from Kaggle
@@ -106,82 +122,58 @@ with DAG(
         - Fetches weather from Open-Meteo API
         - Adds temperature, precipitation, wind speed
         - Creates weather condition flags (is_raining, is_bad_weather)
+        - Pushes the enriched Parquet path to XCom for downstream tasks
         """
     )
     
     # =====================
-    # TASK 4: Train ML Model
-    # =====================
-    train_model_task = PythonOperator(
-        task_id='train_model',
-        python_callable=train_model,
-        doc_md="""
-        Trains a Random Forest model for trip duration prediction:
-        - Uses geographic, temporal, and weather features
-        - Saves model to /models/trip_duration_model.pkl
-        - Logs feature importance and metrics
-        """
-    )
-    
-    # =====================
-    # TASK 5: Load to PostgreSQL
-    # =====================
-    load_postgres_task = PythonOperator(
-        task_id='load_to_postgres',
-        python_callable=load_to_postgres,
-        doc_md="""
-        Loads enriched data to PostgreSQL:
-        - Creates taxi_trips table
-        - Bulk inserts data with proper types
-        - Creates indexes for query performance
-        - Ready for Power BI connection
-        """
-    )
-    
-    # =====================
-    # TASK 6: Generate Report
-    # =====================
-    generate_report_task = PythonOperator(
-        task_id='generate_report',
-        python_callable=generate_report,
-        doc_md="""
-        Generates PDF analytics report:
-        - Daily trip volume chart
-        - Hourly distribution analysis
-        - Weather impact visualization
-        - Key metrics summary
-        """
-    )
-    
-    # =====================
-    # TASK 7: Send Slack Notification
-    # =====================
-    def notify_success(**context):
-        """Send success notification via Slack."""
-        send_slack_notification(success=True)
-    
-    def notify_failure(context):
-        """Send failure notification via Slack."""
-        error_msg = str(context.get('exception', 'Unknown error'))
-        send_slack_notification(success=False, error_message=error_msg)
-    
-    notify_slack_task = PythonOperator(
-        task_id='notify_slack',
-        python_callable=notify_success,
-        trigger_rule='all_success',
-        doc_md="Sends Slack notification on pipeline completion."
-    )
-    
+    # POST-ENRICH FAN-OUT: Train / Load / Report
+    # =====================
+    # Grouped so the scheduler resolves the fan-out as one unit; Slack
+    # notification happens via the DAG-level callbacks above
+    with TaskGroup('postprocess') as postprocess_group:
+        train_model_task = PythonOperator(
+            task_id='train_model',
+            python_callable=train_model,
+            op_kwargs={'input_path': "{{ ti.xcom_pull(task_ids='enrich_weather') }}"},
+            doc_md="""
+            Trains a gradient boosting model for trip duration prediction:
+            - Uses geographic, temporal, and weather features
+            - Saves model to /models/trip_duration_model.pkl
+            - Logs feature importance and metrics
+            """
+        )
+
+        load_postgres_task = PythonOperator(
+            task_id='load_to_postgres',
+            python_callable=load_to_postgres,
+            op_kwargs={'input_path': "{{ ti.xcom_pull(task_ids='enrich_weather') }}"},
+            doc_md="""
+            Loads enriched data to PostgreSQL:
+            - Creates taxi_trips table
+            - Bulk inserts data with proper types
+            - Creates indexes for query performance
+            - Ready for Power BI connection
+            """
+        )
+
+        generate_report_task = PythonOperator(
+            task_id='generate_report',
+            python_callable=generate_report,
+            doc_md="""
+            Generates PDF analytics report:
+            - Daily trip volume chart
+            - Hourly distribution analysis
+            - Weather impact visualization
+            - Key metrics summary
+            """
+        )
+
+        # Within the group: report needs the Postgres load; training runs
+        # in parallel with the load + report branch
+        load_postgres_task >> generate_report_task
+
     # =====================
     # TASK DEPENDENCIES
     # =====================
-    # Define the pipeline flow
-    (
-        check_data_arrival 
-        >> process_data_task 
-        >> enrich_weather_task 
-        >> train_model_task 
-        >> load_postgres_task 
-        >> generate_report_task 
-        >> notify_slack_task
-    )
+    check_data_arrival >> process_data_task >> enrich_weather_task >> postprocess_group
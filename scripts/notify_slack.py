@@ -3,6 +3,8 @@ Slack Notification Script - NYC Taxi ETL Pipeline
 Sends pipeline completion notifications via Slack webhook.
 """
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
 import json
 from datetime import datetime
@@ -15,6 +17,21 @@ logger = logging.getLogger(__name__)
 # Slack webhook URL from environment
 SLACK_WEBHOOK_URL = os.environ.get('SLACK_WEBHOOK_URL', '')
 
+# Shared session: keeps the webhook connection alive across notifications
+# and retries transient Slack errors with backoff instead of dropping the
+# notification on the first hiccup
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=1,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=['POST']
+    )
+))
+
 # Paths for metrics
 METRICS_PATH = '/opt/airflow/models/model_metrics.txt'
 REPORT_DIR = '/opt/airflow/data/reports'
@@ -136,7 +153,7 @@ def send_slack_notification(success=True, error_message=None):
         }
     
     try:
-        response = requests.post(
+        response = _SESSION.post(
             SLACK_WEBHOOK_URL,
             json=message,
             headers={'Content-Type': 'application/json'},
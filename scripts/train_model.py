@@ -1,13 +1,16 @@
 """
 Machine Learning Model Training - NYC Taxi Trip Duration Prediction
-Trains a Random Forest model to predict trip duration.
+Trains a histogram gradient boosting model to predict trip duration.
 """
 import pandas as pd
 import numpy as np
+import pyarrow.parquet as pq
 from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestRegressor
+from sklearn.ensemble import HistGradientBoostingRegressor
+from sklearn.inspection import permutation_importance
 from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+import joblib
 import pickle
 import os
 import logging
@@ -17,55 +20,71 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 logger = logging.getLogger(__name__)
 
 # Paths
-ENRICHED_DATA_PATH = '/opt/airflow/data/processed/enriched_taxi_data.csv'
+ENRICHED_DATA_PATH = '/opt/airflow/data/processed/enriched_taxi_data.parquet'
 MODEL_PATH = '/opt/airflow/models/trip_duration_model.pkl'
 METRICS_PATH = '/opt/airflow/models/model_metrics.txt'
 
 
-def train_model():
+FEATURE_COLUMNS = [
+    # Geographic features
+    'pickup_latitude', 'pickup_longitude',
+    'dropoff_latitude', 'dropoff_longitude',
+    'trip_distance_km',
+
+    # Time features
+    'pickup_hour', 'pickup_dayofweek', 'pickup_month',
+    'is_weekend', 'is_rush_hour',
+
+    # Passenger info
+    'passenger_count', 'vendor_id',
+
+    # Weather features
+    'temperature_c', 'humidity_pct', 'precipitation_mm',
+    'wind_speed_kmh', 'is_raining', 'is_bad_weather'
+]
+
+
+def train_model(input_path=ENRICHED_DATA_PATH):
     """Train trip duration prediction model."""
-    logger.info(f"Loading enriched data from {ENRICHED_DATA_PATH}")
-    
-    # Load data
-    df = pd.read_csv(ENRICHED_DATA_PATH)
-    logger.info(f"Loaded {len(df):,} records for training")
-    
-    # Sample if dataset is too large (for faster training)
-    if len(df) > 500000:
-        df = df.sample(n=500000, random_state=42)
-        logger.info(f"Sampled down to {len(df):,} records")
-    
+    logger.info(f"Loading enriched data from {input_path}")
+
     # =====================
     # FEATURE SELECTION
     # =====================
-    
-    feature_columns = [
-        # Geographic features
-        'pickup_latitude', 'pickup_longitude',
-        'dropoff_latitude', 'dropoff_longitude',
-        'trip_distance_km',
-        
-        # Time features
-        'pickup_hour', 'pickup_dayofweek', 'pickup_month',
-        'is_weekend', 'is_rush_hour',
-        
-        # Passenger info
-        'passenger_count', 'vendor_id',
-        
-        # Weather features
-        'temperature_c', 'humidity_pct', 'precipitation_mm',
-        'wind_speed_kmh', 'is_raining', 'is_bad_weather'
-    ]
-    
-    # Ensure all features exist
-    available_features = [col for col in feature_columns if col in df.columns]
+
+    # Check the Parquet schema first, then read only the columns the model
+    # uses - Arrow's column pruning never touches the rest of the file
+    schema_names = pq.read_schema(input_path).names
+    available_features = [col for col in FEATURE_COLUMNS if col in schema_names]
     logger.info(f"Using {len(available_features)} features: {available_features}")
-    
+
+    table = pq.read_table(input_path, columns=available_features + ['trip_duration'])
+    logger.info(f"Loaded {table.num_rows:,} records for training")
+
+    # Sample if dataset is too large (for faster training). Taking the
+    # sampled rows on the Arrow table keeps the discarded rows out of the
+    # pandas frame entirely, instead of materializing all of them just to
+    # drop most in df.sample
+    if table.num_rows > 500000:
+        rng = np.random.default_rng(42)
+        sample_idx = np.sort(rng.choice(table.num_rows, size=500000, replace=False))
+        table = table.take(sample_idx)
+        logger.info(f"Sampled down to {table.num_rows:,} records")
+
+    df = table.to_pandas(self_destruct=True, split_blocks=True)
+
     X = df[available_features].copy()
     y = df['trip_duration'].copy()  # Target in seconds
     
     # Handle any remaining missing values
     X = X.fillna(X.median())
+
+    # Keep the train matrix at float32/int8 - halves its memory footprint
+    # and the DRAM traffic of the histogram split scans vs default float64
+    flag_cols = [c for c in ('is_weekend', 'is_rush_hour', 'is_raining', 'is_bad_weather')
+                 if c in X.columns]
+    X = X.astype({c: np.int8 for c in flag_cols})
+    X = X.astype({c: np.float32 for c in X.columns.difference(flag_cols)})
     
     # =====================
     # TRAIN/TEST SPLIT
@@ -82,18 +101,19 @@ def train_model():
     # MODEL TRAINING
     # =====================
     
-    logger.info("Training Random Forest model...")
-    
-    model = RandomForestRegressor(
-        n_estimators=100,
-        max_depth=15,
-        min_samples_split=10,
-        min_samples_leaf=5,
-        n_jobs=-1,
-        random_state=42,
-        verbose=1
+    logger.info("Training histogram gradient boosting model...")
+
+    # Histogram-binned split finding: feature values are pre-bucketed into
+    # 255 bins, so training scans bins instead of every value per node -
+    # an order of magnitude faster than the exact-split Random Forest this
+    # replaces, with a far smaller serialized model
+    model = HistGradientBoostingRegressor(
+        max_iter=500,
+        max_depth=8,
+        learning_rate=0.05,
+        random_state=42
     )
-    
+
     model.fit(X_train, y_train)
     logger.info("Model training complete!")
     
@@ -122,10 +142,15 @@ def train_model():
     logger.info(f"R² Score: {r2:.4f}")
     logger.info("=" * 50)
     
-    # Feature importance
+    # Feature importance - gradient boosting has no impurity-based
+    # importances, so measure permutation importance on a test-set slice
+    perm = permutation_importance(
+        model, X_test.iloc[:10000], y_test.iloc[:10000],
+        n_repeats=5, random_state=42, n_jobs=-1
+    )
     feature_importance = pd.DataFrame({
         'feature': available_features,
-        'importance': model.feature_importances_
+        'importance': perm.importances_mean
     }).sort_values('importance', ascending=False)
     
     logger.info("\nTop 10 Feature Importances:")
@@ -149,12 +174,19 @@ def train_model():
             'rmse_minutes': rmse_min,
             'r2_score': r2
         },
-        'feature_importance': feature_importance.to_dict()
+        # Importances as a float32 array aligned with 'features' - the
+        # nested dict a DataFrame.to_dict() produces is pure payload bloat,
+        # and the table is trivially rebuilt at load time
+        'importances': perm.importances_mean.astype(np.float32)
     }
     
-    with open(MODEL_PATH, 'wb') as f:
-        pickle.dump(model_data, f)
-    
+    # joblib pickles the estimator's numpy arrays without copying them
+    # through the pickle stream; zlib-3 shrinks the tree arrays several-fold
+    # for little CPU, and the binary pickle protocol avoids the default's
+    # per-object overhead
+    joblib.dump(model_data, MODEL_PATH, compress=3,
+                protocol=pickle.HIGHEST_PROTOCOL)
+
     logger.info(f"Model saved to {MODEL_PATH}")
     
     # Save metrics as text file